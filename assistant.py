@@ -9,22 +9,49 @@ A simple voice-enabled virtual assistant:
 - send email via SMTP
 - wikipedia search
 Configure secrets in .env (EMAIL_USER, EMAIL_PASS, OPENWEATHER_APIKEY)
+Install dependencies with `pip install -r requirements.txt`.
+Speech recognition needs a Vosk model (see VOSK_MODEL_PATH) and/or Google
+Cloud credentials in GOOGLE_APPLICATION_CREDENTIALS for the cloud fallback.
 """
 
 import os
+import asyncio
+import atexit
 import webbrowser
 import subprocess
 import smtplib
 import sys
 import json
-from datetime import datetime
-from time import sleep
+import math
+import contextlib
+import functools
+import hashlib
+import queue
+import re
+import shlex
+import threading
+import wave
+from array import array
+from collections import OrderedDict, deque
+from pathlib import Path
+from types import MappingProxyType
+from time import localtime, monotonic
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
+from urllib.parse import quote, quote_plus
 
-import requests
-import wikipedia
-import speech_recognition as sr
+import aiohttp
+from cachetools import TTLCache
+import sounddevice as sd
+import vosk
+import webrtcvad
+import grpc
 import pyttsx3
+import simpleaudio
+from google.api_core import exceptions as gexc
+from google.auth import exceptions as auth_exceptions
+from google.cloud import speech
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -35,58 +62,618 @@ EMAIL_PASS = os.getenv("EMAIL_PASS")
 OPENWEATHER_APIKEY = os.getenv("OPENWEATHER_APIKEY")
 
 # --- Text-to-speech setup ---
-engine = pyttsx3.init()
-engine.setProperty('rate', 165)  # speak rate (words/min)
-voices = engine.getProperty('voices')
-if voices:
-    # use first voice available; user can change index if desired
-    engine.setProperty('voice', voices[0].id)
+# The engine is created on the speech output thread (below) rather than at
+# import: driver start-up takes a noticeable moment and some drivers (SAPI5)
+# must be used from the thread that created them.
+_engine = None
+
+def _init_engine():
+    global _engine
+    _engine = pyttsx3.init()
+    _engine.setProperty('rate', 165)  # speak rate (words/min)
+    voices = _engine.getProperty('voices')
+    if voices:
+        # use first voice available; user can change index if desired
+        _engine.setProperty('voice', voices[0].id)
+
+# --- Text-to-speech cache ---
+# Synthesized audio is kept as WAV files so phrases the assistant repeats are
+# played straight from disk instead of going through the TTS engine again.
+TTS_CACHE_DIR = Path.home() / ".assistant_tts"
+TTS_CACHE_SIZE = 128  # number of whole phrases kept on disk
+_PHRASE_DIR = TTS_CACHE_DIR / "phrases"
+_FRAGMENT_DIR = TTS_CACHE_DIR / "fragments"
+
+# Replies that start with one of these are spoken as a cached prefix plus the
+# variable rest of the sentence.
+TTS_PREFIXES = ("The time is", "Today is", "Opening", "Searching Wikipedia for", "Weather in")
+MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December")
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+CLOCK_WORDS = ("oh", "o'clock", "AM", "PM")
+# Fragments are synthesized once at startup and never evicted; tell_time and
+# tell_date are spoken entirely from them (years are added on first use).
+TTS_FRAGMENTS = frozenset(TTS_PREFIXES + MONTHS + WEEKDAYS + CLOCK_WORDS
+                          + tuple(str(n) for n in range(60)))
+
+_WORD_SEP = re.compile(r"[,\s]+")
+_tts_index = OrderedDict()  # phrase hash -> wav path, least recently used first
+_tts_file_cache = True  # cleared when the driver's files turn out not to be WAV
+
+def _load_tts_index():
+    _PHRASE_DIR.mkdir(parents=True, exist_ok=True)
+    _FRAGMENT_DIR.mkdir(parents=True, exist_ok=True)
+    # file mtimes record recency across runs
+    phrases = [p for p in _PHRASE_DIR.glob("*.wav") if not p.name.startswith("~")]
+    for path in sorted(phrases, key=lambda p: p.stat().st_mtime):
+        _tts_index[path.stem] = path
+
+_load_tts_index()
+
+def _synthesize(jobs):
+    """Render (text, path) pairs to WAV files with a single engine run.
+    Paths the driver produced nothing for are left missing."""
+    if not jobs:
+        return
+    tmps = []
+    for text, path in jobs:
+        tmp = path.with_name("~" + path.name)  # keep the extension; some drivers pick the format from it
+        _engine.save_to_file(text, str(tmp))
+        tmps.append((tmp, path))
+    _engine.runAndWait()  # one driver round trip for the whole batch
+    for tmp, path in tmps:
+        if tmp.exists() and tmp.stat().st_size > 0:
+            os.replace(tmp, path)
+
+def _fragment_path(text):
+    return _FRAGMENT_DIR / (hashlib.sha1(text.encode("utf-8")).hexdigest() + ".wav")
+
+def _phrase_path(text):
+    key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    path = _tts_index.get(key)
+    if path is not None and path.exists():
+        _tts_index.move_to_end(key)
+        os.utime(path)
+        return path
+    return _PHRASE_DIR / (key + ".wav")
+
+def _remember_phrase(path):
+    if path.stem in _tts_index:
+        return
+    _tts_index[path.stem] = path
+    while len(_tts_index) > TTS_CACHE_SIZE:
+        _, old = _tts_index.popitem(last=False)
+        old.unlink(missing_ok=True)
+
+def _plan_speech(text):
+    """Split text into (is_fragment, piece) parts to play back to back.
+    A tuple is an already split sequence of fragments."""
+    if isinstance(text, tuple):
+        return [(True, piece) for piece in text]
+    if text in TTS_FRAGMENTS:
+        return [(True, text)]
+    for prefix in TTS_PREFIXES:
+        if text.startswith(prefix + " "):
+            rest = text[len(prefix):].strip()
+            words = _WORD_SEP.split(rest)
+            if all(w in TTS_FRAGMENTS for w in words):
+                return [(True, prefix)] + [(True, w) for w in words]
+            return [(True, prefix), (False, rest)]
+    return [(False, text)]
+
+def _wav_paths(texts):
+    """WAV files to play for each text, synthesizing every miss in one batch.
+    An entry is None if some part of that text could not be synthesized."""
+    plans, jobs = [], {}
+    for text in texts:
+        plan = []
+        for is_fragment, piece in _plan_speech(text):
+            path = _fragment_path(piece) if is_fragment else _phrase_path(piece)
+            if not path.exists():
+                jobs[path] = piece
+            plan.append((is_fragment, path))
+        plans.append(plan)
+    _synthesize([(piece, path) for path, piece in jobs.items()])
+    result = []
+    for plan in plans:
+        if not all(path.exists() for _, path in plan):
+            result.append(None)
+            continue
+        for is_fragment, path in plan:
+            if not is_fragment:
+                _remember_phrase(path)
+        result.append([path for _, path in plan])
+    return result
+
+def _play_wavs(paths):
+    """Concatenate WAV files with matching formats and play them."""
+    chunks, params = [], None
+    for path in paths:
+        with wave.open(str(path), "rb") as w:
+            p = (w.getnchannels(), w.getsampwidth(), w.getframerate())
+            if params and p != params:
+                simpleaudio.play_buffer(b"".join(chunks), *params).wait_done()
+                chunks = []
+            params = p
+            chunks.append(w.readframes(w.getnframes()))
+    if chunks:
+        simpleaudio.play_buffer(b"".join(chunks), *params).wait_done()
+
+def _say_direct(texts):
+    for text in texts:
+        _engine.say(" ".join(text) if isinstance(text, tuple) else text)
+    _engine.runAndWait()
+
+def _say_batch(texts):
+    global _tts_file_cache
+    if not _tts_file_cache:
+        _say_direct(texts)
+        return
+    for i, (text, paths) in enumerate(zip(texts, _wav_paths(texts))):
+        if not paths:
+            _say_direct([text])
+            continue
+        try:
+            _play_wavs(paths)
+        except (wave.Error, EOFError):
+            # driver wrote something other than PCM WAV (e.g. AIFF on macOS);
+            # stop synthesizing to files for the rest of the run
+            _tts_file_cache = False
+            _say_direct(texts[i:])
+            return
+
+# --- Speech output thread ---
+# speak() only queues the text; a single thread owns the engine and plays
+# replies in order, so the caller can already open the microphone while the
+# reply is still being spoken.
+TTS_BATCH_WINDOW = 0.01  # replies queued this close together share one engine run
+_tts_queue = queue.Queue()  # lists of texts
+_tts_idle = threading.Event()  # set while nothing is queued or playing
+_tts_idle.set()
+_tts_pending = 0
+_tts_pending_lock = threading.Lock()
+_tts_thread = None
+_tts_failed = False  # no usable TTS driver; replies are only printed
+
+def _tts_worker():
+    global _tts_pending, _tts_failed
+    try:
+        _init_engine()
+    except Exception as e:
+        print("Text-to-speech unavailable, replies will only be printed:", e)
+        with _tts_pending_lock:
+            _tts_failed = True
+            _tts_pending = 0
+            _tts_idle.set()
+        _drain(_tts_queue)
+        return
+    fragments = sorted(TTS_FRAGMENTS)
+    while True:
+        if fragments and _tts_file_cache and _tts_queue.empty():
+            # nothing to say: synthesize the next few startup fragments
+            try:
+                _wav_paths(fragments[:8])
+                del fragments[:8]
+            except Exception as e:
+                print("Speech cache warm-up stopped:", e)
+                fragments = []  # keep the thread alive for normal replies
+            continue
+        batch = list(_tts_queue.get())
+        entries = 1
+        while True:
+            try:
+                batch.extend(_tts_queue.get(timeout=TTS_BATCH_WINDOW))
+                entries += 1
+            except queue.Empty:
+                break
+        try:
+            _say_batch(batch)
+        except Exception as e:
+            print("Speech output error:", e)
+        with _tts_pending_lock:
+            _tts_pending -= entries
+            if _tts_pending == 0:
+                _tts_idle.set()
+
+def start_speech_output():
+    """Start the speech output thread (and with it the engine) if not running yet."""
+    global _tts_thread
+    with _tts_pending_lock:
+        if _tts_thread is None:
+            _tts_thread = threading.Thread(target=_tts_worker, daemon=True)
+            _tts_thread.start()
+
+def _enqueue_speech(items):
+    global _tts_pending
+    start_speech_output()
+    with _tts_pending_lock:
+        if _tts_failed:
+            return
+        _tts_pending += 1
+        _tts_idle.clear()
+    _tts_queue.put(items)
+
+def speak_batch(texts):
+    """Queue several texts to be spoken with one engine run, printing each."""
+    for text in texts:
+        print("Assistant:", text)
+    _enqueue_speech(list(texts))
 
 def speak(text: str):
-    """Speak text and also print to console."""
+    """Queue text to be spoken and also print to console."""
+    speak_batch([text])
+
+def speak_fragments(text: str, fragments):
+    """Print text but speak it as the given sequence of cached fragments."""
     print("Assistant:", text)
-    engine.say(text)
-    engine.runAndWait()
+    _enqueue_speech([tuple(fragments)])
+
+def speak_and_wait(text: str):
+    """Speak text and block until everything queued so far has been played."""
+    speak(text)
+    _tts_idle.wait()
 
 # --- Speech recognition ---
-recognizer = sr.Recognizer()
+# Commands are decoded on-device with Vosk while they are being captured.
+# Low-confidence results (and setups without a Vosk model) go to Google Cloud
+# streaming recognition, which needs GOOGLE_APPLICATION_CREDENTIALS to point at
+# a service-account key.
 MIC_INDEX = None  # Use default microphone. Set to integer to pick a different device.
+SAMPLE_RATE = 16000
+FRAME_MS = 30  # webrtcvad accepts 10, 20 or 30 ms frames
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+SPEECH_END_TIMEOUT_MS = 400  # trailing silence that ends an utterance
+PRE_ROLL_MS = 300  # audio kept from just before speech is detected, so the first word isn't clipped
+VAD_AGGRESSIVENESS = 2  # 0 (least) .. 3 (most aggressive at filtering non-speech)
 
-def listen(timeout=5, phrase_time_limit=8):
-    """Listen to microphone and return recognized text (or None)."""
-    with sr.Microphone(device_index=MIC_INDEX) as source:
-        recognizer.adjust_for_ambient_noise(source, duration=0.6)
-        print("Listening...")
+vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+ENERGY_RATIO = 1.5  # speech must be this much louder than the measured ambient level
+energy_threshold = None  # measured when the first mic session opens
+
+# download from https://alphacephei.com/vosk/models and unpack here
+VOSK_MODEL_PATH = os.getenv(
+    "VOSK_MODEL_PATH", str(Path(__file__).parent / "models" / "vosk-model-small-en-us-0.15"))
+VOSK_MIN_CONFIDENCE = 0.6  # below this, ask the cloud recognizer instead
+vosk.SetLogLevel(-1)
+_vosk_model = None
+_vosk_lock = threading.Lock()
+
+def _get_vosk_model():
+    """Load the Vosk model on first use; None if it isn't installed."""
+    global _vosk_model
+    with _vosk_lock:
+        if _vosk_model is None and os.path.isdir(VOSK_MODEL_PATH):
+            _vosk_model = vosk.Model(VOSK_MODEL_PATH)
+    return _vosk_model
+
+# One client for the whole session: the TLS handshake, OAuth token exchange and
+# gRPC channel are paid once instead of on every listen() call. Raw LINEAR16
+# frames go over the channel gzip-compressed, with no container framing.
+# Built on first use, so a Vosk-only setup needs no Google credentials.
+SPEECH_ENDPOINT = "speech.googleapis.com:443"
+_speech_client = None
+_speech_client_error = None  # missing credentials are remembered, not looked up every turn
+_speech_client_lock = threading.Lock()
+
+def _get_speech_client():
+    """Return the Cloud Speech client; raises DefaultCredentialsError without credentials."""
+    global _speech_client, _speech_client_error
+    with _speech_client_lock:
+        if _speech_client_error is not None:
+            raise _speech_client_error
+        if _speech_client is None:
+            try:
+                _speech_client = speech.SpeechClient(transport=SpeechGrpcTransport(
+                    host=SPEECH_ENDPOINT,
+                    channel=SpeechGrpcTransport.create_channel(
+                        SPEECH_ENDPOINT, compression=grpc.Compression.Gzip)))
+            except auth_exceptions.DefaultCredentialsError as e:
+                _speech_client_error = e
+                raise
+    return _speech_client
+
+# The commands this assistant understands; biasing recognition towards them
+# (plus the app and site names from apps / _QUICK_SITES) makes short
+# utterances come back faster and more accurately.
+COMMAND_PHRASES = [
+    "hello", "what time is it", "what's the date", "what day is it",
+    "open", "open app", "launch", "weather in", "who is", "what is",
+    "tell me about", "send an email", "yes", "stop assistant", "goodbye",
+]
+
+@functools.lru_cache(maxsize=None)
+def _streaming_config():
+    """Built on first use, once the app and site mappings below are defined."""
+    phrases = COMMAND_PHRASES + list(apps) + list(_QUICK_SITES)
+    return speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SAMPLE_RATE,
+            language_code="en-US",
+            model="command_and_search",
+            speech_contexts=[speech.SpeechContext(phrases=phrases)],
+        ),
+        single_utterance=True,
+        interim_results=True,
+    )
+
+def _prewarm_recognizers():
+    """Load the local model, or, when the cloud is the only recognizer, send a
+    tiny silent request so auth and the channel are up before the first command."""
+    if _get_vosk_model() is not None:
+        return  # the cloud is only a fallback; connect on first use
+    try:
+        _get_speech_client().recognize(
+            config=_streaming_config().config,
+            audio=speech.RecognitionAudio(content=bytes(SAMPLE_RATE // 10 * 2)),
+            timeout=10)
+    except Exception:
+        pass  # best effort; listen() will report real errors
+
+def _rms(frame):
+    """Root-mean-square level of a 16-bit mono PCM frame."""
+    samples = array('h', frame)
+    return math.sqrt(sum(s * s for s in samples) / len(samples)) if samples else 0.0
+
+def _calibrate(q, duration=1.0):
+    """Measure ambient noise once per run instead of before every command."""
+    global energy_threshold
+    levels = [_rms(q.get()) for _ in range(int(duration * 1000) // FRAME_MS)]
+    energy_threshold = ENERGY_RATIO * sum(levels) / len(levels)
+
+def _is_speech(frame):
+    # webrtcvad (C) rejects most silent frames before the level is computed
+    return vad.is_speech(frame, SAMPLE_RATE) and _rms(frame) > energy_threshold
+
+def _utterance_frames(q, stop, timeout, phrase_time_limit, heard):
+    """Yield mic frames from shortly before the first speech until
+    SPEECH_END_TIMEOUT_MS of silence; sets heard once speech has started.
+    Per-frame work is the VAD plus, for voiced frames, _rms(); this loop only counts."""
+    wait_frames = timeout * 1000 // FRAME_MS
+    max_frames = phrase_time_limit * 1000 // FRAME_MS
+    end_frames = SPEECH_END_TIMEOUT_MS // FRAME_MS
+    pre_roll = deque(maxlen=PRE_ROLL_MS // FRAME_MS)
+    waited = spoken = silent = 0
+    while not stop.is_set():
         try:
-            audio = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
-        except sr.WaitTimeoutError:
-            print("No speech detected (timeout).")
-            return None
+            frame = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if not _tts_idle.is_set():
+            continue  # a background action started talking; don't transcribe ourselves
+        speaking = _is_speech(frame)
+        if not heard.is_set():
+            if not speaking:
+                pre_roll.append(frame)
+                waited += 1
+                if waited >= wait_frames:
+                    return
+                continue
+            heard.set()
+            yield from pre_roll
+        yield frame
+        spoken += 1
+        silent = 0 if speaking else silent + 1
+        if silent >= end_frames or spoken >= max_frames:
+            return
+
+def _cloud_recognize(frames, deadline):
+    """Stream frames to Cloud Speech; returns the final transcript or None."""
+    # wait for speech before opening the RPC, so the stream is never idle
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return None
+
+    def stream_requests():
+        yield speech.StreamingRecognizeRequest(streaming_config=_streaming_config())
+        yield speech.StreamingRecognizeRequest(audio_content=first)
+        for frame in frames:
+            yield speech.StreamingRecognizeRequest(audio_content=frame)
+        # generator exhausted -> stream half-closes and the server finalizes
+
     try:
-        text = recognizer.recognize_google(audio)
-        print("You:", text)
-        return text.lower()
-    except sr.UnknownValueError:
-        print("Couldn't understand audio.")
+        for response in _get_speech_client().streaming_recognize(
+                requests=stream_requests(), timeout=deadline):
+            for result in response.results:
+                if result.is_final and result.alternatives:
+                    return result.alternatives[0].transcript.strip()
+    except gexc.DeadlineExceeded:
+        pass
+    return None
+
+def _recognize(frames, deadline):
+    model = _get_vosk_model()
+    if model is None:
+        return _cloud_recognize(frames, deadline)
+    rec = vosk.KaldiRecognizer(model, SAMPLE_RATE)
+    rec.SetWords(True)
+    captured, segments = [], []
+    for frame in frames:
+        # decode while capturing; keep the audio in case the cloud is needed
+        captured.append(frame)
+        if rec.AcceptWaveform(frame):
+            # Vosk found a pause inside the utterance; this segment is only
+            # available now, FinalResult() returns what follows it
+            segments.append(json.loads(rec.Result()))
+    if not captured:
         return None
-    except sr.RequestError as e:
+    segments.append(json.loads(rec.FinalResult()))
+    words = [w for seg in segments for w in seg.get("result") or []]
+    text = " ".join(seg["text"] for seg in segments if seg.get("text"))
+    if words and sum(w["conf"] for w in words) / len(words) >= VOSK_MIN_CONFIDENCE:
+        return text
+    try:
+        return _cloud_recognize(captured, deadline)
+    except auth_exceptions.DefaultCredentialsError:
+        return text or None  # no cloud configured; the local guess is all we have
+
+def _drain(q):
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+
+def _listen_on(q, timeout, phrase_time_limit):
+    stop = threading.Event()
+    heard = threading.Event()
+    # the stream is already open; wait for our own reply to finish and
+    # drop what the mic picked up meanwhile so it isn't transcribed
+    _tts_idle.wait()
+    _drain(q)
+    print("Listening...")
+    try:
+        text = _recognize(_utterance_frames(q, stop, timeout, phrase_time_limit, heard),
+                          deadline=timeout + phrase_time_limit + 5)
+    except gexc.GoogleAPICallError as e:
+        print("Speech recognition service error:", e)
+        return None
+    except auth_exceptions.DefaultCredentialsError as e:
+        print("No Vosk model found and Google Cloud credentials are not configured:", e)
+        return None
+    except auth_exceptions.GoogleAuthError as e:
+        # token refresh / auth transport failures are not GoogleAPICallErrors
         print("Speech recognition service error:", e)
         return None
+    finally:
+        stop.set()
+    if text:
+        print("You:", text)
+        return text.lower()
+    if heard.is_set():
+        print("Couldn't understand audio.")
+    else:
+        print("No speech detected (timeout).")
+    return None
+
+_mic_session = None  # ask() of the session currently open, if any
+
+@contextlib.contextmanager
+def open_mic_session():
+    """Keep one microphone stream open for several turns.
+
+    Yields ask(timeout=5, phrase_time_limit=8), which listens like listen().
+    Opening a session while one is already open reuses it.
+    """
+    global _mic_session
+    if _mic_session is not None:
+        yield _mic_session
+        return
+    q = queue.Queue()
+
+    def on_audio(indata, frames, time_info, status):
+        # runs on the sounddevice thread; just hand the bytes over
+        q.put(bytes(indata))
+
+    def ask(timeout=5, phrase_time_limit=8):
+        return _listen_on(q, timeout, phrase_time_limit)
+
+    with sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=FRAME_SAMPLES, dtype='int16',
+                           channels=1, device=MIC_INDEX, callback=on_audio):
+        if energy_threshold is None:
+            _calibrate(q)
+        _mic_session = ask
+        try:
+            yield ask
+        finally:
+            _mic_session = None
+
+def listen(timeout=5, phrase_time_limit=8):
+    """Listen to microphone and return recognized text (or None)."""
+    with open_mic_session() as ask:
+        return ask(timeout, phrase_time_limit)
+
+# --- Network I/O ---
+# HTTP calls run on one event loop in a background thread and share a pooled
+# aiohttp session, so repeat requests to the same host skip the TCP/TLS setup.
+HTTP_TIMEOUT = 8
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, daemon=True).start()
+
+async def _new_http_session():
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=16, keepalive_timeout=75),
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        headers={"User-Agent": "Virtual-Assistance/1.0 (voice assistant)"})
+
+def _run(coro, timeout=HTTP_TIMEOUT):
+    """Run a coroutine on the network loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result(timeout=timeout)
+
+_HTTP = _run(_new_http_session())
+atexit.register(lambda: _run(_HTTP.close()))
+
+async def _get_json(url, params=None):
+    async with _HTTP.get(url, params=params) as r:
+        r.raise_for_status()
+        return await r.json()
 
 # --- Helpers ---
 def tell_time():
-    now = datetime.now()
-    t = now.strftime("%I:%M %p")
-    speak(f"The time is {t}")
+    now = localtime()
+    hour = now.tm_hour % 12 or 12
+    ampm = "AM" if now.tm_hour < 12 else "PM"
+    if now.tm_min == 0:
+        minute = ("o'clock",)
+    elif now.tm_min < 10:
+        minute = ("oh", str(now.tm_min))
+    else:
+        minute = (str(now.tm_min),)
+    speak_fragments(f"The time is {hour:02d}:{now.tm_min:02d} {ampm}",
+                    ("The time is", str(hour)) + minute + (ampm,))
 
 def tell_date():
-    today = datetime.today()
-    speak("Today is " + today.strftime("%A, %B %d, %Y"))
+    today = localtime()
+    weekday = WEEKDAYS[today.tm_wday]
+    month = MONTHS[today.tm_mon - 1]
+    speak_fragments(f"Today is {weekday}, {month} {today.tm_mday:02d}, {today.tm_year}",
+                    ("Today is", weekday, month, str(today.tm_mday), str(today.tm_year)))
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+WIKI_TTL = 300
+_wiki_cache = TTLCache(maxsize=32, ttl=WIKI_TTL)  # query -> summary; only used on _LOOP
+
+async def _wiki_page_summary(title):
+    """REST page summary (one request, plain-text extract); None if there is no such page."""
+    try:
+        return await _get_json("https://en.wikipedia.org/api/rest_v1/page/summary/" + quote(title, safe=""))
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            return None
+        raise
+
+async def _wiki_search_title(query, exclude=None):
+    """Best matching article title from the action API search."""
+    data = await _get_json("https://en.wikipedia.org/w/api.php", {
+        "action": "query", "list": "search", "srsearch": query, "srlimit": 3, "format": "json"})
+    for hit in data["query"]["search"]:
+        if hit["title"] != exclude:
+            return hit["title"]
+    return None
+
+async def _wiki_summary_async(query):
+    key = query.lower()
+    summary = _wiki_cache.get(key)
+    if summary is not None:
+        return summary
+    data = await _wiki_page_summary(query)
+    if data is None or data.get("type") == "disambiguation":
+        # no exact page, or an ambiguous one: take the top search hit instead
+        title = await _wiki_search_title(query, exclude=data and data.get("title"))
+        data = title and await _wiki_page_summary(title)
+        if not data:
+            raise LookupError(query)
+    # keep it short when spoken: first two sentences
+    summary = " ".join(_SENTENCE_END.split(data["extract"], maxsplit=2)[:2])
+    _wiki_cache[key] = summary
+    return summary
 
 def search_wikipedia(query):
     try:
         speak(f"Searching Wikipedia for {query}")
-        summary = wikipedia.summary(query, sentences=2, auto_suggest=True)
+        # up to three requests when the topic needs a search first
+        summary = _run(_wiki_summary_async(query), timeout=3 * HTTP_TIMEOUT)
         speak(summary)
     except Exception as e:
         speak("Sorry, I couldn't find that on Wikipedia.")
@@ -97,59 +684,184 @@ def open_website(url):
     speak(f"Opening {url}")
     webbrowser.open(url)
 
+# Map friendly names to commands. Modify paths per your OS.
+apps = {
+    "notepad": {"win": r"notepad.exe", "mac": None, "linux": "gedit"},
+    "calculator": {"win": "calc.exe", "mac": "open -a Calculator", "linux": "gnome-calculator"},
+    # add your own paths here
+    "code": {"win": r"C:\Users\%USERNAME%\AppData\Local\Programs\Microsoft VS Code\Code.exe",
+             "mac": "open -a 'Visual Studio Code'", "linux": "code"}
+}
+
+_PLATFORM_KEY = ('win' if sys.platform.startswith('win')
+                 else 'mac' if sys.platform.startswith('darwin') else 'linux')
+
+def _split_command(cmd):
+    """Turn a configured command string into an argv list."""
+    if _PLATFORM_KEY == "win":
+        # Windows entries are a single exe path (may contain spaces and %VARS%);
+        # shlex would treat the backslashes as escapes
+        return [os.path.expandvars(cmd)]
+    return shlex.split(cmd)
+
+# this platform's argv per app, parsed once at import
+_APPS = MappingProxyType({k: _split_command(d[_PLATFORM_KEY]) if d.get(_PLATFORM_KEY) else None
+                          for k, d in apps.items()})
+
 def open_app(app_key):
-    """Map friendly names to commands. Modify paths per your OS."""
-    apps = {
-        "notepad": {"win": r"notepad.exe", "mac": None, "linux": "gedit"},
-        "calculator": {"win": "calc.exe", "mac": "open -a Calculator", "linux": "gnome-calculator"},
-        # add your own paths here
-        "code": {"win": r"C:\Users\%USERNAME%\AppData\Local\Programs\Microsoft VS Code\Code.exe",
-                 "mac": "open -a 'Visual Studio Code'", "linux": "code"}
-    }
-    platform = sys.platform
-    if app_key not in apps:
+    if app_key not in _APPS:
         speak(f"I don't have a mapping for {app_key}. You can add it to the apps dict.")
         return
-    cmd = None
-    if platform.startswith("win"):
-        cmd = apps[app_key].get("win")
-        if cmd:
-            speak(f"Opening {app_key}")
-            subprocess.Popen(cmd)  # Windows, can be exe path
-            return
-    elif platform.startswith("darwin"):
-        cmd = apps[app_key].get("mac")
-    else:
-        cmd = apps[app_key].get("linux")
-    if cmd:
-        speak(f"Opening {app_key}")
-        try:
-            subprocess.Popen(cmd.split())  # naive split for mac/linux; adjust if needed
-        except Exception as e:
-            # fallback to open
-            try:
-                subprocess.call(cmd, shell=True)
-            except Exception as e2:
-                speak("Could not open the application: " + str(e2))
-    else:
+    argv = _APPS[app_key]
+    if not argv:
         speak("No command configured for your OS; please update the apps mapping in the script.")
+        return
+    speak(f"Opening {app_key}")
+    try:
+        # detach from the assistant's session; no shell in between
+        subprocess.Popen(argv, start_new_session=True, close_fds=True)
+    except OSError as e:
+        speak("Could not open the application: " + str(e))
+
+async def _get_weather_async(city):
+    params = {"q": city, "appid": OPENWEATHER_APIKEY, "units": "metric"}
+    return await _get_json("https://api.openweathermap.org/data/2.5/weather", params)
+
+# Weather answers are reused for WEATHER_TTL seconds, and the last city asked
+# about is refreshed in the background so asking again is answered from memory.
+# Unknown cities are remembered briefly so a typo isn't retried every turn.
+WEATHER_TTL = 300
+WEATHER_REFRESH = 240
+_weather_cache = TTLCache(maxsize=32, ttl=WEATHER_TTL)  # city -> (desc, temp, feels, fetched_at)
+_weather_misses = TTLCache(maxsize=32, ttl=30)  # city -> error message
+_weather_lock = threading.Lock()  # the refresh timer writes from its own thread
+_weather_last_city = None
+_weather_timer = None
+
+def _fetch_weather(city):
+    data = _run(_get_weather_async(city))
+    entry = (data['weather'][0]['description'], data['main']['temp'],
+             data['main']['feels_like'], monotonic())
+    with _weather_lock:
+        _weather_cache[city.lower()] = entry
+    return entry
+
+def _refresh_last_city():
+    with _weather_lock:
+        city = _weather_last_city
+    try:
+        _fetch_weather(city)
+    except Exception:
+        pass  # keep the old entry; a real lookup will report errors
+    _schedule_weather_refresh(from_timer=True)
+
+def _schedule_weather_refresh(from_timer=False):
+    """(Re)start the single refresh timer. Lookups run on several threads, so
+    the swap happens under the lock; a timer that was replaced while it was
+    refreshing does not reschedule itself."""
+    global _weather_timer
+    with _weather_lock:
+        if from_timer and threading.current_thread() is not _weather_timer:
+            return
+        if _weather_timer is not None:
+            _weather_timer.cancel()
+        _weather_timer = threading.Timer(WEATHER_REFRESH, _refresh_last_city)
+        _weather_timer.daemon = True
+        _weather_timer.start()
 
 def get_weather(city):
+    global _weather_last_city
     if not OPENWEATHER_APIKEY:
         speak("Weather API key is not configured. Please set OPENWEATHER_APIKEY in your .env.")
         return
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {"q": city, "appid": OPENWEATHER_APIKEY, "units": "metric"}
+    key = city.lower()
+    with _weather_lock:
+        entry = _weather_cache.get(key)
+        error = _weather_misses.get(key)
+    if error:
+        speak("Failed to get weather: " + error)
+        return
+    if entry is None:
+        try:
+            entry = _fetch_weather(city)
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                with _weather_lock:
+                    _weather_misses[key] = str(e)
+            speak("Failed to get weather: " + str(e))
+            return
+        except Exception as e:
+            speak("Failed to get weather: " + str(e))
+            return
+    with _weather_lock:
+        city_changed = key != (_weather_last_city or "").lower()
+        if city_changed:
+            _weather_last_city = city
+    if city_changed:
+        _schedule_weather_refresh()
+    desc, temp, feels, _ = entry
+    speak(f"Weather in {city}: {desc}. Temperature {temp} °C, feels like {feels} °C.")
+
+# One authenticated SMTP connection for the whole session. Implicit TLS on
+# port 465 saves the STARTTLS round trip, and a NOOP every SMTP_KEEPALIVE
+# seconds stops the server from dropping it while idle.
+# example for Gmail SMTP; change for other providers
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 465
+SMTP_KEEPALIVE = 180
+_SMTP_DROPPED = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+_smtp = None
+_smtp_lock = threading.Lock()
+_smtp_timer = None
+
+def _drop_smtp():
+    """Close and forget the current connection. Call with _smtp_lock held."""
+    global _smtp
+    if _smtp is not None:
+        _smtp.close()
+        _smtp = None
+
+def _get_smtp():
+    """Return a live, logged-in connection. Call with _smtp_lock held."""
+    global _smtp
+    if _smtp is not None:
+        try:
+            if _smtp.noop()[0] == 250:
+                return _smtp
+        except _SMTP_DROPPED:
+            pass
+        _drop_smtp()
+    server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=10)
     try:
-        r = requests.get(url, params=params, timeout=8)
-        r.raise_for_status()
-        data = r.json()
-        desc = data['weather'][0]['description']
-        temp = data['main']['temp']
-        feels = data['main']['feels_like']
-        speak(f"Weather in {city}: {desc}. Temperature {temp} °C, feels like {feels} °C.")
-    except Exception as e:
-        speak("Failed to get weather: " + str(e))
+        server.login(EMAIL_USER, EMAIL_PASS)
+    except Exception:
+        server.close()
+        raise
+    _smtp = server
+    _schedule_smtp_keepalive()
+    return server
+
+def _smtp_keepalive():
+    with _smtp_lock:
+        if _smtp is None:
+            return
+        try:
+            _smtp.noop()
+        except _SMTP_DROPPED:
+            _drop_smtp()  # reconnect on the next send
+            return
+        _schedule_smtp_keepalive(from_timer=True)
+
+def _schedule_smtp_keepalive(from_timer=False):
+    """(Re)start the keepalive timer. Call with _smtp_lock held."""
+    global _smtp_timer
+    if from_timer and threading.current_thread() is not _smtp_timer:
+        return  # a newer connection replaced this timer's chain
+    if _smtp_timer is not None:
+        _smtp_timer.cancel()
+    _smtp_timer = threading.Timer(SMTP_KEEPALIVE, _smtp_keepalive)
+    _smtp_timer.daemon = True
+    _smtp_timer.start()
 
 def send_email(to_addr, subject, body):
     """Send email using SMTP. EMAIL_USER and EMAIL_PASS must be set in environment."""
@@ -162,14 +874,13 @@ def send_email(to_addr, subject, body):
         msg['To'] = to_addr
         msg['Subject'] = subject
         msg.set_content(body)
-        # example for Gmail SMTP; change for other providers
-        smtp_host = 'smtp.gmail.com'
-        smtp_port = 587
-        server = smtplib.SMTP(smtp_host, smtp_port)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASS)
-        server.send_message(msg)
-        server.quit()
+        with _smtp_lock:
+            try:
+                _get_smtp().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # dropped between the NOOP and the send; reconnect once
+                _drop_smtp()
+                _get_smtp().send_message(msg)
         speak("Email sent successfully.")
         return True
     except Exception as e:
@@ -177,101 +888,137 @@ def send_email(to_addr, subject, body):
         return False
 
 # --- Main loop and command parsing ---
-def parse_and_execute(text):
-    if text is None:
-        return
+_GREETINGS = frozenset(["hello", "hi", "hey"])
 
-    # greeting
-    if any(kw in text for kw in ["hello", "hi", "hey"]):
-        speak("Hello! How can I help you?")
-
-    # time/date
-    elif "time" in text:
-        tell_time()
-    elif "date" in text or "day" in text:
-        tell_date()
-
-    # open website
-    elif text.startswith("open "):
-        # "open youtube" -> open youtube.com
-        target = text.replace("open ", "").strip()
-        # common quick mapping
-        quick = {"youtube":"youtube.com", "google":"google.com", "gmail":"mail.google.com"}
-        if target in quick:
-            open_website(quick[target])
-        else:
-            # if target looks like a domain or 'website' assume domain
-            open_website(target)
-
-    # open application
-    elif "launch " in text or "open app " in text or "open application" in text:
-        # try to extract app name
-        for prefix in ["launch ", "open app ", "open application "]:
-            if prefix in text:
-                appname = text.split(prefix,1)[1].strip().split()[0]
-                open_app(appname)
-                return
-
-    # wikipedia
-    elif text.startswith("who is ") or text.startswith("what is ") or text.startswith("tell me about "):
-        # extract topic
-        topic = text.replace("who is ", "").replace("what is ", "").replace("tell me about ", "").strip()
-        search_wikipedia(topic)
-
-    # weather
-    elif "weather" in text:
-        # "weather in london" or "what's the weather in paris"
-        words = text.split()
-        if "in" in words:
-            idx = words.index("in")
-            city = " ".join(words[idx+1:])
-            if city:
-                get_weather(city)
-                return
+# All commands in one pattern, tried in priority order; the outer group that
+# matched names the handler and the inner group (if any) is its payload.
+_INTENT_RE = re.compile(r"""
+    (?P<time>.*\btime\b)
+  | (?P<date>.*\b(?:date|day)\b)
+  | (?P<app>.*?\b(?:launch|open\ application|open\ app)\s+(?P<app_name>\S+))
+  | (?P<website>open\s+(?P<site>.+))
+  | (?P<weather>.*\bweather\b(?:.*?\bin\s+(?P<city>.+))?)
+  | (?P<wiki>(?:who\ is|what\ is|tell\ me\ about)\s+(?P<topic>.+))
+  | (?P<email>.*\bsend\ (?:an\ )?email\b)
+  | (?P<quit>.*\b(?:quit|exit|shutdown|stop\ assistant|goodbye)\b)
+""", re.VERBOSE)
+_INTENT_PAYLOAD = {"app": "app_name", "website": "site", "weather": "city", "wiki": "topic"}
+
+@functools.lru_cache(maxsize=128)
+def _classify(text):
+    """Map recognized text to (handler_name, payload).
+
+    Cached: users repeat the same handful of commands, and the result only
+    depends on the text (quick-site and app mappings are resolved by the
+    handlers), so both hits and the fallback are safe to keep.
+    """
+    if not _GREETINGS.isdisjoint(text.split()):
+        return "greet", None
+    m = _INTENT_RE.match(text)
+    if m is None:
+        # fallback: use web search
+        return "search", text
+    payload = _INTENT_PAYLOAD.get(m.lastgroup)
+    if payload:
+        payload = m.group(payload)
+        payload = payload.strip() if payload else None
+    return m.lastgroup, payload
+
+# common quick mapping for "open <name>"; anything else is taken as a domain
+_QUICK_SITES = MappingProxyType({"youtube": "youtube.com", "google": "google.com",
+                                 "gmail": "mail.google.com"})
+
+def _open_target(target):
+    open_website(_QUICK_SITES.get(target, target))
+
+def _weather(city):
+    if city:
+        get_weather(city)
+    else:
         # if no city, use default or ask user (we avoid asking per guidelines)
         speak("Please include the city after 'in', e.g. 'weather in Delhi'.")
 
-    # send email
-    elif "send email" in text or "send an email" in text:
+def _email_dialog(_):
+    # one mic stream for the whole dialog instead of re-opening it per answer
+    with open_mic_session() as ask:
         speak("Who is the recipient? Please say the email address.")
-        to_addr = listen(timeout=8, phrase_time_limit=6)
+        to_addr = ask(timeout=8, phrase_time_limit=6)
         if not to_addr:
             speak("Recipient not provided. Cancelling.")
             return
         speak("What is the subject?")
-        subject = listen(timeout=8, phrase_time_limit=8) or "No subject"
+        subject = ask(timeout=8, phrase_time_limit=8) or "No subject"
         speak("Tell me the message.")
-        body = listen(timeout=12, phrase_time_limit=20) or ""
+        body = ask(timeout=12, phrase_time_limit=20) or ""
         # confirmation (simple)
+        # ask() waits for this to finish playing before it starts counting
         speak(f"Sending email to {to_addr} with subject {subject}. Confirm by saying yes.")
-        conf = listen(timeout=5, phrase_time_limit=3)
-        if conf and "yes" in conf:
-            send_email(to_addr, subject, body)
-        else:
-            speak("Email cancelled.")
+        conf = ask(timeout=5, phrase_time_limit=3)
+    if conf and "yes" in conf:
+        send_email(to_addr, subject, body)
+    else:
+        speak("Email cancelled.")
+
+def _quit(_):
+    speak_and_wait("Goodbye!")
+    sys.exit(0)
+
+def _web_search(text):
+    speak("I didn't catch a command. I can search the web or Wikipedia. Searching the web for your phrase.")
+    # open a search in default browser
+    webbrowser.open("https://www.google.com/search?q=" + quote_plus(text))
 
-    # stop/quit
-    elif any(kw in text for kw in ["quit", "exit", "shutdown", "stop assistant", "goodbye"]):
-        speak("Goodbye!")
-        sys.exit(0)
+DISPATCH = {
+    "greet": lambda _: speak("Hello! How can I help you?"),
+    "time": lambda _: tell_time(),
+    "date": lambda _: tell_date(),
+    "website": _open_target,
+    "app": open_app,
+    "wiki": search_wikipedia,
+    "weather": _weather,
+    "email": _email_dialog,
+    "quit": _quit,
+    "search": _web_search,
+}
 
+# Handlers that hold a conversation need the microphone (or end the process),
+# so they run on the main thread; the rest run on a worker so listening for
+# the next command starts while e.g. a weather lookup is still in flight.
+_INTERACTIVE = frozenset(["email", "quit"])
+_actions = ThreadPoolExecutor(max_workers=2, thread_name_prefix="action")
+
+def _run_action(handler_name, payload):
+    try:
+        DISPATCH[handler_name](payload)
+    except Exception as e:
+        print(f"Error in {handler_name} handler:", e)
+
+def parse_and_execute(text):
+    if text is None:
+        return
+    handler_name, payload = _classify(text)
+    if handler_name in _INTERACTIVE:
+        DISPATCH[handler_name](payload)
     else:
-        # fallback: use web search
-        speak("I didn't catch a command. I can search the web or Wikipedia. Searching the web for your phrase.")
-        # open a search in default browser
-        query = text.replace(" ", "+")
-        webbrowser.open(f"https://www.google.com/search?q={query}")
+        _actions.submit(_run_action, handler_name, payload)
 
 def main_loop():
-    speak("Assistant online. Say 'hello' to start, or say a command.")
-    while True:
-        text = listen()
-        parse_and_execute(text)
-        # small idle delay
-        sleep(0.3)
+    if not os.path.isdir(VOSK_MODEL_PATH):
+        # the cloud is the only recognizer; without credentials every listen would fail
+        try:
+            _get_speech_client()
+        except auth_exceptions.DefaultCredentialsError as e:
+            sys.exit(f"No Vosk model found and Google Cloud credentials are not configured: {e}")
+    # engine start-up and recognizer warm-up overlap the ambient-noise calibration
+    start_speech_output()
+    threading.Thread(target=_prewarm_recognizers, daemon=True).start()
+    with open_mic_session() as ask:
+        speak("Assistant online. Say 'hello' to start, or say a command.")
+        while True:
+            parse_and_execute(ask())
 
 if __name__ == "__main__":
     try:
         main_loop()
     except KeyboardInterrupt:
-        speak("Shutting down. Bye!")
+        speak_and_wait("Shutting down. Bye!")